@@ -2,8 +2,23 @@ import { TFile, Notice, App, Editor } from "obsidian";
 import { gatherDescendantFiles } from "./time-tree-calculator";
 import * as YAML from "yaml";
 
+// Compiled once at load rather than on every call
+const yamlRegex = /^---\n([\s\S]*?)\n---/;
+const trackerRegex = /```simple-time-tracker\n({.*?})\n```/s;
+
+interface CachedFrontMatter {
+	mtime: number;
+	size: number;
+	frontmatter: any;
+}
+
 export class FrontMatterManager {
 	private app: App;
+	// Parsed front matter by file path, valid while the file stat matches
+	private frontMatterCache: Map<string, CachedFrontMatter> = new Map();
+	// Last queued rewrite per file path, so two updates to one note never
+	// read the same content and drop each other's changes
+	private pendingWrites: Map<string, Promise<void>> = new Map();
 
 	constructor(app: App) {
 		this.app = app;
@@ -13,31 +28,61 @@ export class FrontMatterManager {
 		file: TFile,
 		property: string
 	): Promise<boolean | number> {
-		let propertyValue: boolean | number = false;
+		const frontmatter = await this.getFrontMatter(file);
+		return frontmatter[property] ?? false;
+	}
+
+	// Reads every property of a note in one go, for callers needing several
+	async getFrontMatter(file: TFile): Promise<any> {
+		const cached = this.frontMatterCache.get(file.path);
+		if (
+			cached &&
+			cached.mtime === file.stat.mtime &&
+			cached.size === file.stat.size
+		) {
+			return cached.frontmatter;
+		}
+		const { mtime, size } = file.stat;
+		let frontmatter = {};
 		try {
-			const content = await this.app.vault.read(file);
-			const yamlRegex = /^---\n([\s\S]*?)\n---/;
+			const content = await this.app.vault.cachedRead(file);
 			const yamlMatch = content.match(yamlRegex);
 			if (yamlMatch) {
-				const frontmatter = YAML.parse(yamlMatch[1]) || {};
-				propertyValue = frontmatter[property] ?? false;
+				frontmatter = YAML.parse(yamlMatch[1]) || {};
 			}
 		} catch (err) {
 			console.error("Error reading file:", file.path, err);
+			return frontmatter;
 		}
-		return propertyValue;
+		this.frontMatterCache.set(file.path, { mtime, size, frontmatter });
+		return frontmatter;
 	}
 
-	async updateProperty(
+	updateProperty(
+		file: TFile,
+		updater: (frontmatter: any) => any
+	): Promise<void> {
+		const previous = this.pendingWrites.get(file.path) ?? Promise.resolve();
+		const run = previous.then(() => this.writeProperty(file, updater));
+		const settled = run.catch(() => undefined);
+		this.pendingWrites.set(file.path, settled);
+		settled.then(() => {
+			if (this.pendingWrites.get(file.path) === settled) {
+				this.pendingWrites.delete(file.path);
+			}
+		});
+		return run;
+	}
+
+	private async writeProperty(
 		file: TFile,
 		updater: (frontmatter: any) => any
 	): Promise<void> {
 		let content = await this.app.vault.read(file);
-		const yamlRegex = /^---\n([\s\S]*?)\n---/;
 		const yamlMatch = content.match(yamlRegex);
 		let newYamlBlock: string;
+		let frontmatter: any = {};
 		try {
-			let frontmatter = {};
 			if (yamlMatch) {
 				frontmatter = YAML.parse(yamlMatch[1]) || {};
 			}
@@ -48,6 +93,10 @@ export class FrontMatterManager {
 			console.error(e);
 			return;
 		}
+		// Values already as requested: leave the note and its mtime alone
+		if (yamlMatch && newYamlBlock === yamlMatch[0]) {
+			return;
+		}
 		let newContent: string;
 		if (yamlMatch) {
 			let afterYaml = content.slice(yamlMatch[0].length);
@@ -59,6 +108,12 @@ export class FrontMatterManager {
 			newContent = newYamlBlock + "\n" + content;
 		}
 		await this.app.vault.modify(file, newContent);
+		// Cache what was just written so reading it back needs no parse
+		this.frontMatterCache.set(file.path, {
+			mtime: file.stat.mtime,
+			size: file.stat.size,
+			frontmatter,
+		});
 	}
 
 	// Helper function to find the end of YAML front matter (line L is the last YAML line).
@@ -122,17 +177,22 @@ export class FrontMatterManager {
 
 	async adjustCursorOutsideTracker(editor: Editor): Promise<void> {
 		const content = editor.getValue();
+		// A literal search is enough to rule out notes without a tracker
+		// before splitting the whole document into lines
+		if (!content.includes("```simple-time-tracker")) {
+			return;
+		}
 		const lines = content.split("\n");
 
 		const yamlEnd = this.getYamlEnd(lines);
 		const trackerBlocks = this.getTrackerBlocks(lines, yamlEnd);
-		const targetLine = this.findTargetLine(lines, yamlEnd, trackerBlocks);
 
 		const cursor = editor.getCursor();
 		if (!this.isLineInTracker(cursor.line, trackerBlocks)) {
 			return;
 		}
 
+		const targetLine = this.findTargetLine(lines, yamlEnd, trackerBlocks);
 		editor.setCursor({ line: targetLine, ch: 0 });
 	}
 
@@ -160,34 +220,26 @@ export class FrontMatterManager {
 		const fileContent = editor.getValue();
 
 		// Match the simple-time-tracker block
-		const trackerRegex = /```simple-time-tracker\n({.*?})\n```/s;
 		const match = fileContent.match(trackerRegex);
 
 		if (!match) return null;
 
-		const trackerJson = match[1];
-
-		// Match entries array
-		const entriesRegex = /"entries":\s*\[(.*?)\]/s;
-		const entriesMatch = trackerJson.match(entriesRegex);
-
-		if (!entriesMatch) return null;
-
-		const entriesString = entriesMatch[1];
-
-		// Match individual entries using regex
-		const entryRegex = /\{.*?"name":.*?"startTime":.*?"endTime":.*?\}/gs;
-		const allEntries = [...entriesString.matchAll(entryRegex)].map(
-			(m) => m[0]
-		);
+		// Parse the block once with the native parser instead of
+		// re-scanning it with regexes for the entries and each entry
+		let allEntries: object[];
+		try {
+			allEntries = JSON.parse(match[1]).entries;
+		} catch (err) {
+			console.error("Error parsing tracker block:", err);
+			return null;
+		}
 
-		if (allEntries.length === 0) return null;
+		if (!Array.isArray(allEntries) || allEntries.length === 0) return null;
 
 		// Determine index
 		const index = position >= 0 ? position : allEntries.length + position;
 		if (index < 0 || index >= allEntries.length) return null;
 
-		// Parse and return the selected entry
-		return JSON.parse(allEntries[index]);
+		return allEntries[index];
 	}
 }
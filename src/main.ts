@@ -1,16 +1,31 @@
-import { Plugin, TFile, Notice, Editor, MarkdownView } from "obsidian";
+import {
+	Plugin,
+	TFile,
+	Notice,
+	Editor,
+	MarkdownView,
+	EventRef,
+} from "obsidian";
 import { defaultSettings, TimeTreeSettings } from "./settings";
 import { TimeTreeSettingsTab } from "./settings-tab";
 import { FrontMatterManager } from "./front-matter-manager";
 import { TimeTreeCalculator } from "./time-tree-calculator";
 
 export default class TimeTreePlugin extends Plugin {
-	public api = (this.app as any).plugins.plugins["simple-time-tracker"].api;
 	public settings: TimeTreeSettings;
 	private frontMatterManager: FrontMatterManager;
 	private calculator: TimeTreeCalculator;
-	private computeIntervalHandle: any;
-	private buttonObserver: MutationObserver | null = null;
+	private computeIntervalHandle: number | null = null;
+	private computeInProgress = false;
+	// Tail of the queue of tree-wide updates; each one starts only after
+	// the previous has settled so their front matter writes never interleave
+	private treeUpdate: Promise<void> = Promise.resolve();
+
+	// Looked up on use rather than at construction, so this plugin can
+	// load before simple-time-tracker does
+	public get api(): any {
+		return (this.app as any).plugins.plugins["simple-time-tracker"]?.api;
+	}
 
 	async onload(): Promise<void> {
 		await this.loadSettings();
@@ -18,7 +33,7 @@ export default class TimeTreePlugin extends Plugin {
 		this.calculator = new TimeTreeCalculator(
 			this.app,
 			this.settings,
-			this.api,
+			() => this.api,
 			this.frontMatterManager
 		);
 
@@ -128,56 +143,73 @@ export default class TimeTreePlugin extends Plugin {
 			},
 		});
 
-		this.buttonObserver = new MutationObserver((mutations) => {
-			const delay = (ms: number) =>
-				new Promise((resolve) => setTimeout(resolve, ms));
-			mutations.forEach((mutation) => {
-				mutation.addedNodes.forEach((node) => {
-					if (node instanceof HTMLElement) {
-						const btn = node.querySelector(
-							".simple-time-tracker-btn"
-						) as HTMLButtonElement | null;
-						if (btn) {
-							btn.addEventListener("click", async () => {
-								const btnStatus =
-									btn.getAttribute("aria-label");
-								if (btnStatus === "End") {
-									this.elapsedTime();
-									await delay(100);
-									await this.updateNoteProperty(
-										"running",
-										"false",
-										false
-									);
-								} else {
-									await delay(100);
-									await this.updateNoteProperty(
-										"running",
-										"true",
-										false
-									);
-								}
-							});
-						}
-					}
-				});
-			});
-		});
-		this.buttonObserver.observe(document.body, {
-			childList: true,
-			subtree: true,
+		// One delegated listener instead of observing every DOM mutation
+		// and attaching a listener to each tracker button that appears
+		this.registerDomEvent(document, "click", async (evt: MouseEvent) => {
+			const target = evt.target;
+			if (!(target instanceof Element)) {
+				return;
+			}
+			const btn = target.closest(".simple-time-tracker-btn");
+			if (!btn) {
+				return;
+			}
+			// The note is captured at click time, so switching notes while
+			// the updates below are pending cannot redirect them
+			const activeFile = this.app.workspace.getActiveFile();
+			if (!activeFile) {
+				return;
+			}
+			// Wait for the tracker plugin to save the toggled block
+			// rather than sleeping for a fixed delay
+			const trackerSaved = this.waitForModify(activeFile, 1000);
+			const btnStatus = btn.getAttribute("aria-label");
+			await trackerSaved;
+			if (btnStatus === "End") {
+				// Cleared first so a failing elapsed update cannot leave the
+				// note flagged as running
+				await this.updateNoteProperty(
+					"running",
+					"false",
+					false,
+					activeFile
+				);
+				await this.elapsedTime(activeFile);
+			} else {
+				await this.updateNoteProperty(
+					"running",
+					"true",
+					false,
+					activeFile
+				);
+			}
 		});
 
 		this.scheduleComputeTimeTree();
 	}
 
-	onunload(): void {
-		if (this.buttonObserver) {
-			this.buttonObserver.disconnect();
-		}
-		if (this.computeIntervalHandle) {
-			clearInterval(this.computeIntervalHandle);
-		}
+	// Resolves on the next modification of the file, or once the timeout
+	// elapses if no modification happens
+	waitForModify(file: TFile, timeoutMs: number): Promise<void> {
+		return new Promise((resolve) => {
+			let eventRef: EventRef | null = null;
+			let timeoutHandle: number | null = null;
+			const finish = () => {
+				if (timeoutHandle !== null) {
+					window.clearTimeout(timeoutHandle);
+				}
+				if (eventRef) {
+					this.app.vault.offref(eventRef);
+				}
+				resolve();
+			};
+			eventRef = this.app.vault.on("modify", (modified) => {
+				if (modified.path === file.path) {
+					finish();
+				}
+			});
+			timeoutHandle = window.setTimeout(finish, timeoutMs);
+		});
 	}
 
 	async loadSettings(): Promise<void> {
@@ -214,55 +246,77 @@ export default class TimeTreePlugin extends Plugin {
 		}
 	}
 
-	async elapsedTime(): Promise<void> {
-		const activeFile = this.app.workspace.getActiveFile();
+	async elapsedTime(
+		activeFile: TFile | null = this.app.workspace.getActiveFile()
+	): Promise<void> {
 		if (!activeFile) {
 			new Notice("No active file found.");
 			return;
 		}
+		if (!this.hasTrackerApi()) {
+			return;
+		}
+		const file = activeFile;
 		let elapsed = 0;
-		elapsed = await this.calculator.calculateElapsedTime(activeFile);
-		await new Promise((resolve) => setTimeout(resolve, 10));
-		await this.frontMatterManager.updateProperty(
-			activeFile,
-			(frontmatter) => {
-				frontmatter.elapsed = elapsed;
-				return frontmatter;
-			}
-		);
-		await this.calculator.communicateAscendants(activeFile);
-		const rootPath = this.settings.rootNotePath;
-		if (rootPath) {
-			const rootFile = this.app.vault.getAbstractFileByPath(rootPath);
-			if (rootFile && rootFile instanceof TFile) {
+		await this.runTreeUpdate(async () => {
+			elapsed = await this.calculator.calculateElapsedTime(file);
+			await new Promise((resolve) => setTimeout(resolve, 10));
+			await this.frontMatterManager.updateProperty(
+				file,
+				(frontmatter) => {
+					frontmatter.elapsed = elapsed;
+					return frontmatter;
+				}
+			);
+			await this.calculator.communicateAscendants(file);
+			const rootFile = this.getRootFile(false);
+			if (rootFile) {
 				await this.calculator.updateNodeSizeFromFile(rootFile);
 			}
-		}
+		});
 		new Notice(`Updated elapsed time: ${elapsed}`);
 	}
 
-	async computeTimeTree(): Promise<void> {
-		const rootPath = this.settings.rootNotePath;
-		if (!rootPath) {
+	// Queues a task that rewrites notes across the tree behind any such
+	// task still running, and resolves or rejects with that task alone
+	private runTreeUpdate(task: () => Promise<void>): Promise<void> {
+		const run = this.treeUpdate.then(task);
+		this.treeUpdate = run.catch(() => undefined);
+		return run;
+	}
+
+	// Elapsed times come from the tracker plugin; without it every note
+	// would be rewritten with zero, so bail out instead
+	hasTrackerApi(): boolean {
+		if (!this.api) {
 			new Notice(
-				"Root note path is not configured in Time Tree settings."
+				"Simple Time Tracker plugin is not enabled. Time Tree needs it to read elapsed time."
 			);
+			return false;
+		}
+		return true;
+	}
+
+	async computeTimeTree(): Promise<void> {
+		// Scheduled runs must not overlap a computation still in progress
+		if (this.computeInProgress) {
 			return;
 		}
-		const rootFile = this.app.vault.getAbstractFileByPath(rootPath);
-		if (!rootFile || !(rootFile instanceof TFile)) {
-			new Notice(`Root note ${rootPath} not found.`);
+		const rootFile = this.getRootFile();
+		if (!rootFile || !this.hasTrackerApi()) {
 			return;
 		}
 
 		// Show a persistent loading notification
 		const loadingNotice = new Notice("Computing Time Tree...", 0);
+		this.computeInProgress = true;
 		try {
-			await this.calculator.calculateRecursiveElapsedTime(rootFile);
-			await this.calculator.calculateRecursiveElapsedChild(rootFile);
-			await this.calculator.updateNodeSizeFromFile(rootFile);
-			new Notice(`Time Tree computed from note: ${rootPath}`, 2000);
+			await this.runTreeUpdate(() =>
+				this.calculator.computeTimeTree(rootFile)
+			);
+			new Notice(`Time Tree computed from note: ${rootFile.path}`, 2000);
 		} finally {
+			this.computeInProgress = false;
 			loadingNotice.hide();
 		}
 	}
@@ -286,9 +340,9 @@ export default class TimeTreePlugin extends Plugin {
 	async updateNoteProperty(
 		property: string,
 		value: string,
-		verbose: boolean = true
+		verbose: boolean = true,
+		activeFile: TFile | null = this.app.workspace.getActiveFile()
 	): Promise<void> {
-		const activeFile = this.app.workspace.getActiveFile();
 		if (!activeFile) {
 			new Notice("No active file found.");
 			return;
@@ -313,17 +367,8 @@ export default class TimeTreePlugin extends Plugin {
 	}
 
 	async openRunningNote(): Promise<void> {
-		const rootPath = this.settings.rootNotePath;
-		if (!rootPath) {
-			new Notice(
-				"Root note path is not configured in Time Tree settings."
-			);
-			return;
-		}
-
-		const rootFile = this.app.vault.getAbstractFileByPath(rootPath);
-		if (!rootFile || !(rootFile instanceof TFile)) {
-			new Notice(`Root note ${rootPath} not found.`);
+		const rootFile = this.getRootFile();
+		if (!rootFile) {
 			return;
 		}
 
@@ -337,17 +382,40 @@ export default class TimeTreePlugin extends Plugin {
 		}
 	}
 
+	getRootFile(verbose: boolean = true): TFile | null {
+		const rootPath = this.settings.rootNotePath;
+		if (!rootPath) {
+			if (verbose) {
+				new Notice(
+					"Root note path is not configured in Time Tree settings."
+				);
+			}
+			return null;
+		}
+		const rootFile = this.app.vault.getAbstractFileByPath(rootPath);
+		if (!rootFile || !(rootFile instanceof TFile)) {
+			if (verbose) {
+				new Notice(`Root note ${rootPath} not found.`);
+			}
+			return null;
+		}
+		return rootFile;
+	}
+
 	scheduleComputeTimeTree(): void {
 		// Clear any existing interval
-		if (this.computeIntervalHandle) {
-			clearInterval(this.computeIntervalHandle);
+		if (this.computeIntervalHandle !== null) {
+			window.clearInterval(this.computeIntervalHandle);
+			this.computeIntervalHandle = null;
 		}
 		// Only schedule if the compute interval is greater than 0 (enabled)
 		if (this.settings.computeIntervalMinutes > 0) {
 			const intervalMs = this.settings.computeIntervalMinutes * 60 * 1000;
-			this.computeIntervalHandle = setInterval(async () => {
+			this.computeIntervalHandle = window.setInterval(async () => {
 				await this.computeTimeTree();
 			}, intervalMs);
+			// Registered intervals are cleared by Obsidian on unload
+			this.registerInterval(this.computeIntervalHandle);
 		}
 	}
 }
@@ -1,10 +1,16 @@
-import { App, PluginSettingTab, Setting, TFolder } from "obsidian";
+import { App, PluginSettingTab, Setting, TFolder, debounce } from "obsidian";
 import TimeTreePlugin from "./main";
 import { TimeTreeSettings } from "./settings";
 
 export class TimeTreeSettingsTab extends PluginSettingTab {
 	plugin: TimeTreePlugin;
 	settings: TimeTreeSettings;
+	// Text fields change on every keystroke; save once typing pauses
+	private requestSave = debounce(
+		() => this.plugin.saveSettings(),
+		500,
+		true
+	);
 
 	constructor(app: App, plugin: TimeTreePlugin) {
 		super(app, plugin);
@@ -28,14 +34,14 @@ export class TimeTreeSettingsTab extends PluginSettingTab {
 					.setValue(this.settings.rootNotePath)
 					.onChange(async (value) => {
 						this.settings.rootNotePath = value;
-						await this.plugin.saveSettings();
+						this.requestSave();
 					});
 
 				// Create a datalist element for file suggestions
 				const dataList = this.containerEl.createEl("datalist", {
 					attr: { id: "file-datalist" },
 				});
-				const files = this.app.vault.getFiles();
+				const files = this.app.vault.getMarkdownFiles();
 				files.forEach((file) => {
 					dataList.createEl("option", { attr: { value: file.path } });
 				});
@@ -52,7 +58,7 @@ export class TimeTreeSettingsTab extends PluginSettingTab {
 					.setValue(this.settings.RootFolderPath)
 					.onChange(async (value) => {
 						this.settings.RootFolderPath = value;
-						await this.plugin.saveSettings();
+						this.requestSave();
 					});
 
 				// Create a datalist element for folder suggestions using all folders from the vault recursively
@@ -2,32 +2,68 @@ import { App, TFile, Notice } from "obsidian";
 import { TimeTreeSettings } from "./settings";
 import { FrontMatterManager } from "./front-matter-manager";
 
+const trackerBlockRegex = /```simple-time-tracker[\s\S]*?```/g;
+const runningEntryRegex = /"endTime":\s*null/;
+
+// Child notes by parent path, shared by the passes of one computation so
+// each note's links are resolved only once.
+export type ChildIndex = Map<string, TFile[]>;
+
+// Resolves the notes linked from a file, each child listed once even when
+// it is linked several times.
+export function getChildFiles(
+	file: TFile,
+	app: App,
+	childIndex?: ChildIndex
+): TFile[] {
+	const indexed = childIndex?.get(file.path);
+	if (indexed) {
+		return indexed;
+	}
+	const children: TFile[] = [];
+	childIndex?.set(file.path, children);
+	const fileCache = app.metadataCache.getFileCache(file);
+	if (!fileCache || !fileCache.links) {
+		return children;
+	}
+	const seen = new Set<string>();
+	for (const link of fileCache.links) {
+		const childFile = app.metadataCache.getFirstLinkpathDest(
+			link.link,
+			file.path
+		);
+		if (childFile && !seen.has(childFile.path)) {
+			seen.add(childFile.path);
+			children.push(childFile);
+		}
+	}
+	return children;
+}
+
 export async function gatherDescendantFiles(
 	file: TFile,
 	app: App,
-	visited: Set<string> = new Set()
+	visited: Set<string> = new Set(),
+	childIndex?: ChildIndex
 ): Promise<TFile[]> {
-	let files: TFile[] = [];
+	const files: TFile[] = [];
 	if (visited.has(file.path)) {
 		return files;
 	}
 	visited.add(file.path);
-	const fileCache = app.metadataCache.getFileCache(file);
-	if (fileCache && fileCache.links && fileCache.links.length > 0) {
-		for (const link of fileCache.links) {
-			const childFile = app.metadataCache.getFirstLinkpathDest(
-				link.link,
-				file.path
-			);
-			if (childFile) {
-				files.push(childFile);
-				const descendants = await gatherDescendantFiles(
-					childFile,
-					app,
-					visited
-				);
-				files.push(...descendants);
-			}
+	// Depth-first with an explicit stack so deep trees cannot overflow the
+	// call stack; children are pushed reversed to keep the link order.
+	const stack = getChildFiles(file, app, childIndex).slice().reverse();
+	while (stack.length > 0) {
+		const current = stack.pop() as TFile;
+		if (visited.has(current.path)) {
+			continue;
+		}
+		visited.add(current.path);
+		files.push(current);
+		const children = getChildFiles(current, app, childIndex);
+		for (let i = children.length - 1; i >= 0; i--) {
+			stack.push(children[i]);
 		}
 	}
 	return files;
@@ -36,126 +72,206 @@ export async function gatherDescendantFiles(
 export class TimeTreeCalculator {
 	private app: App;
 	private settings: TimeTreeSettings;
-	private api: any;
+	private getApi: () => any;
 	private frontMatterManager: FrontMatterManager;
+	// Elapsed time by note path, keyed on the note's tracker blocks alone so
+	// front matter rewrites do not force the trackers to be parsed again
+	private elapsedCache: Map<
+		string,
+		{ mtime: number; trackers: string; elapsed: number }
+	> = new Map();
 
 	constructor(
 		app: App,
 		settings: TimeTreeSettings,
-		api: any,
+		getApi: () => any,
 		frontMatterManager: FrontMatterManager
 	) {
 		this.app = app;
 		this.settings = settings;
-		this.api = api;
+		this.getApi = getApi;
 		this.frontMatterManager = frontMatterManager;
 	}
 
 	async calculateElapsedTime(file: TFile): Promise<number> {
-		const trackers = await this.api.loadAllTrackers(file.path);
+		const cached = this.elapsedCache.get(file.path);
+		// An untouched file cannot have new tracker entries, skip reading it
+		if (cached && cached.mtime === file.stat.mtime) {
+			return cached.elapsed;
+		}
+		const { mtime } = file.stat;
+		const content = await this.app.vault.cachedRead(file);
+		const trackerBlocks = (content.match(trackerBlockRegex) ?? []).join(
+			"\n"
+		);
+		if (cached && cached.trackers === trackerBlocks) {
+			cached.mtime = mtime;
+			return cached.elapsed;
+		}
+		const api = this.getApi();
+		if (!api) {
+			throw new Error("Simple Time Tracker plugin is not enabled.");
+		}
+		const trackers = await api.loadAllTrackers(file.path);
 		let localElapsed = 0;
 		if (trackers && trackers.length > 0) {
-			localElapsed = this.api.getTotalDuration(
+			localElapsed = api.getTotalDuration(
 				trackers[0].tracker.entries
 			);
 		}
+		// A running entry keeps growing without the block changing
+		if (runningEntryRegex.test(trackerBlocks)) {
+			this.elapsedCache.delete(file.path);
+		} else {
+			this.elapsedCache.set(file.path, {
+				mtime,
+				trackers: trackerBlocks,
+				elapsed: localElapsed,
+			});
+		}
 		return localElapsed;
 	}
 
-	async calculateRecursiveElapsedTime(file: TFile): Promise<number> {
-		let localElapsed = await this.calculateElapsedTime(file);
-		await this.frontMatterManager.updateProperty(file, (frontmatter) => {
-			frontmatter.elapsed = localElapsed;
-			return frontmatter;
-		});
-		const fileCache = this.app.metadataCache.getFileCache(file);
-		if (fileCache && fileCache.links && fileCache.links.length > 0) {
-			for (const link of fileCache.links) {
-				const childFile = this.app.metadataCache.getFirstLinkpathDest(
-					link.link,
-					file.path
-				);
-				if (childFile) {
-					await this.calculateRecursiveElapsedTime(childFile);
-				}
-			}
-		}
-		return localElapsed;
+	async computeTimeTree(file: TFile): Promise<void> {
+		const childIndex: ChildIndex = new Map();
+		await this.calculateTreeElapsed(file, childIndex);
+		await this.updateNodeSizeFromFile(file, childIndex);
 	}
 
-	async calculateRecursiveElapsedChild(
+	// Post-order pass that computes each note's own and descendant time and
+	// writes both to its front matter in a single update. Runs on an
+	// explicit stack, so the depth of the tree is not bounded by recursion.
+	async calculateTreeElapsed(
 		file: TFile,
-		recursive: boolean = true
+		childIndex: ChildIndex
 	): Promise<number> {
-		const ownElapsed = (await this.frontMatterManager.getProperty(
-			file,
-			"elapsed"
-		)) as number;
-		const fileCache = this.app.metadataCache.getFileCache(file);
-		const childNotes = (fileCache as any).links;
-		const leafNote = !fileCache || !childNotes || childNotes.length === 0;
-		if (leafNote) {
-			const properties =
-				ownElapsed === 0 ? ["elapsed", "descendants"] : ["descendants"];
-			for (const property of properties) {
-				await this.frontMatterManager.updateProperty(file, (fm) => {
-					fm[property] = 0;
-					return fm;
-				});
-			}
-			return ownElapsed;
-		}
-		let totalDescendantElapsed = 0;
-		for (const link of childNotes) {
-			const childFile = this.app.metadataCache.getFirstLinkpathDest(
-				link.link,
-				file.path
-			);
-			if (childFile) {
-				let childTotal = 0;
-				if (recursive) {
-					childTotal = await this.calculateRecursiveElapsedChild(
-						childFile
-					);
+		// Totals by note path; a note reached again through another parent
+		// reuses its total, and one still in progress (a cycle) counts as 0
+		const totals = new Map<string, number>();
+		const stack: {
+			file: TFile;
+			children: TFile[];
+			next: number;
+			ownElapsed: number;
+			descendantElapsed: number;
+		}[] = [];
+		const enter = async (note: TFile) => {
+			totals.set(note.path, 0);
+			stack.push({
+				file: note,
+				children: getChildFiles(note, this.app, childIndex),
+				next: 0,
+				ownElapsed: await this.calculateElapsedTime(note),
+				descendantElapsed: 0,
+			});
+		};
+
+		await enter(file);
+		while (stack.length > 0) {
+			const frame = stack[stack.length - 1];
+			if (frame.next < frame.children.length) {
+				const childFile = frame.children[frame.next++];
+				const known = totals.get(childFile.path);
+				if (known !== undefined) {
+					frame.descendantElapsed += known;
 				} else {
-					const childElapsed =
-						(await this.frontMatterManager.getProperty(
-							childFile,
-							"elapsed"
-						)) as number;
-					const childElapsedChilds =
-						(await this.frontMatterManager.getProperty(
-							childFile,
-							"descendants"
-						)) as number;
-					childTotal = childElapsed + childElapsedChilds;
+					await enter(childFile);
 				}
-				totalDescendantElapsed += childTotal;
+				continue;
 			}
+			stack.pop();
+			await this.frontMatterManager.updateProperty(frame.file, (fm) => {
+				fm.elapsed = frame.ownElapsed;
+				fm.descendants = frame.descendantElapsed;
+				return fm;
+			});
+			const total = frame.ownElapsed + frame.descendantElapsed;
+			totals.set(frame.file.path, total);
+			if (stack.length > 0) {
+				stack[stack.length - 1].descendantElapsed += total;
+			}
+		}
+		return totals.get(file.path) ?? 0;
+	}
+
+	// Refreshes a single note's `descendants` from the totals already stored
+	// on its direct children, without recursing into them.
+	async updateDescendantsFromChildren(file: TFile): Promise<void> {
+		const childFiles = getChildFiles(file, this.app);
+		if (childFiles.length === 0) {
+			const ownElapsed = (await this.frontMatterManager.getProperty(
+				file,
+				"elapsed"
+			)) as number;
+			await this.frontMatterManager.updateProperty(file, (fm) => {
+				if (ownElapsed === 0) {
+					fm.elapsed = 0;
+				}
+				fm.descendants = 0;
+				return fm;
+			});
+			return;
+		}
+		let totalDescendantElapsed = 0;
+		for (const childFile of childFiles) {
+			const childFrontMatter =
+				await this.frontMatterManager.getFrontMatter(childFile);
+			totalDescendantElapsed +=
+				(childFrontMatter.elapsed ?? 0) +
+				(childFrontMatter.descendants ?? 0);
 		}
 		await this.frontMatterManager.updateProperty(file, (fm) => {
 			fm.descendants = totalDescendantElapsed;
 			return fm;
 		});
-		return ownElapsed + totalDescendantElapsed;
 	}
 
 	async communicateAscendants(file: TFile): Promise<void> {
-		const parent = await this.getParentFile(file);
-		if (parent) {
-			await this.calculateRecursiveElapsedChild(parent, false);
-			await this.communicateAscendants(parent);
+		for (const ancestor of await this.getAncestorFiles(file)) {
+			await this.updateDescendantsFromChildren(ancestor);
 		}
-		return;
 	}
 
-	async getParentFile(file: TFile): Promise<TFile | undefined> {
-		const backlinks = (this.app.metadataCache as any).getBacklinksForFile(
-			file
-		);
+	// Returns the chain of parents from the nearest one up to the root,
+	// stopping if the parent links ever loop back on themselves.
+	async getAncestorFiles(file: TFile): Promise<TFile[]> {
+		const backlinkIndex = this.getBacklinkIndex();
+		const ancestors: TFile[] = [];
+		const visited = new Set<string>([file.path]);
+		let parent = await this.getParentFile(file, backlinkIndex);
+		while (parent && !visited.has(parent.path)) {
+			visited.add(parent.path);
+			ancestors.push(parent);
+			parent = await this.getParentFile(parent, backlinkIndex);
+		}
+		return ancestors;
+	}
+
+	// Maps each note path to the paths of the notes linking to it, built in
+	// a single pass over the resolved links instead of once per lookup.
+	getBacklinkIndex(): Map<string, string[]> {
+		const index = new Map<string, string[]>();
+		const resolvedLinks = this.app.metadataCache.resolvedLinks;
+		for (const sourcePath in resolvedLinks) {
+			for (const targetPath in resolvedLinks[sourcePath]) {
+				const sources = index.get(targetPath);
+				if (sources) {
+					sources.push(sourcePath);
+				} else {
+					index.set(targetPath, [sourcePath]);
+				}
+			}
+		}
+		return index;
+	}
+
+	async getParentFile(
+		file: TFile,
+		backlinkIndex: Map<string, string[]> = this.getBacklinkIndex()
+	): Promise<TFile | undefined> {
 		let candidateFiles: TFile[] = [];
-		for (const source of backlinks["data"]) {
-			const parentFile = this.app.vault.getAbstractFileByPath(source[0]);
+		for (const sourcePath of backlinkIndex.get(file.path) ?? []) {
+			const parentFile = this.app.vault.getAbstractFileByPath(sourcePath);
 			if (parentFile instanceof TFile) {
 				if (this.settings.RootFolderPath) {
 					if (
@@ -181,38 +297,49 @@ export class TimeTreeCalculator {
 		return oldestFile;
 	}
 
-	async updateNodeSizeFromFile(file: TFile): Promise<void> {
-		const descendantFiles = await gatherDescendantFiles(file, this.app);
+	async updateNodeSizeFromFile(
+		file: TFile,
+		childIndex?: ChildIndex
+	): Promise<void> {
+		const descendantFiles = await gatherDescendantFiles(
+			file,
+			this.app,
+			new Set(),
+			childIndex
+		);
 		const files = [file, ...descendantFiles];
 		const accValues: { file: TFile; acc: number }[] = [];
-		for (const file of files) {
-			const elapsed = (await this.frontMatterManager.getProperty(
-				file,
-				"elapsed"
-			)) as number;
-			const elapsedChild = (await this.frontMatterManager.getProperty(
-				file,
-				"descendants"
-			)) as number;
-			const acc = elapsed + elapsedChild;
-			accValues.push({ file, acc });
-		}
-		const accNumbers = accValues.map((item) => item.acc);
 		const minAcc = 0;
-		const maxAcc = Math.max(...accNumbers);
+		// Tracked while collecting; spreading every value into Math.max
+		// needs an extra array and fails past the engine's argument limit
+		let maxAcc = -Infinity;
+		// Notes are independent, so their reads can be in flight together
+		const frontmatters = await Promise.all(
+			files.map((file) => this.frontMatterManager.getFrontMatter(file))
+		);
+		files.forEach((file, i) => {
+			const frontmatter = frontmatters[i];
+			const acc =
+				(frontmatter.elapsed ?? 0) + (frontmatter.descendants ?? 0);
+			accValues.push({ file, acc });
+			if (acc > maxAcc) {
+				maxAcc = acc;
+			}
+		});
 		const min_d = 6;
 		const max_d = 100;
 		const A_min = min_d * min_d;
 		const A_max = max_d * max_d;
+		// Area grows linearly with accumulated time, so the scale factor
+		// is the same for every node and only computed once
+		const areaScale =
+			maxAcc === minAcc ? 0 : (A_max - A_min) / (maxAcc - minAcc);
 		for (const { file, acc } of accValues) {
 			let node_size: number;
 			if (maxAcc === minAcc) {
 				node_size = acc === 0 ? min_d : max_d;
 			} else {
-				const A =
-					A_min +
-					((acc - minAcc) / (maxAcc - minAcc)) * (A_max - A_min);
-				node_size = Math.sqrt(A);
+				node_size = Math.sqrt(A_min + (acc - minAcc) * areaScale);
 			}
 			node_size = Math.round((node_size + Number.EPSILON) * 100) / 100;
 			await this.frontMatterManager.updateProperty(